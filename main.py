@@ -1,10 +1,21 @@
 import customtkinter as ctk
+import httpx
 import ollama
-from ollama import Client
+from ollama import AsyncClient
+import asyncio
 import threading
 import json
+import os
+import time
+import weakref
+from collections import namedtuple
+from contextlib import aclosing
+from dataclasses import dataclass
 from datetime import datetime
+from pathlib import Path
 import re
+import sqlite3
+import tkinter
 
 # --- Constants ---
 APP_NAME = "Kramer UI for Ollama"
@@ -12,6 +23,18 @@ WINDOW_WIDTH = 900
 WINDOW_HEIGHT = 700
 OLLAMA_HOST = 'http://127.0.0.1:11434'
 MAX_CHAT_WIDTH = 1000  # Maximum width for chat area
+MODEL_CACHE_PATH = Path.home() / ".cache" / "kramer-ui" / "models.json"
+MODEL_CACHE_TTL = 300  # Seconds a cached model list is shown before the server answers
+_DATA_HOME = os.environ.get("APPDATA") if os.name == 'nt' else os.environ.get("XDG_DATA_HOME")
+HISTORY_DB_PATH = Path(_DATA_HOME or Path.home() / ".local" / "share") / "kramer-ui" / "history.db"
+MAX_RENDERED_MESSAGES = 100  # Older messages are unrendered until requested
+MAX_CONTEXT_MESSAGES = None  # Set to cap the messages sent with each request; None sends all
+STREAM_REPAINT_MS = 33  # Repaint interval for the streaming message (~30 FPS)
+SHUTDOWN_TIMEOUT = 2.0  # Seconds to wait for background work to wind down on close
+RESIZE_DEBOUNCE_MS = 50  # Delay before re-centering the chat after a resize
+ROOT_RESIZE_TAG = "KramerRootResize"  # Bind tag carried only by the main window
+_THINK_RE = re.compile(r'<think>(.*?)</think>', re.DOTALL)
+_ROW_STICKY = {'user': "e", 'assistant': "ew"}  # Horizontal placement of a message in its row
 
 # Modern color scheme
 COLORS = {
@@ -28,6 +51,108 @@ COLORS = {
     'error': '#ef4444'
 }
 
+def _model_name(model):
+    """Return the name of a listed model, or None if it has none"""
+    if isinstance(model, dict):
+        return model.get('name') or model.get('model')
+    return getattr(model, 'model', None)
+
+class _ThinkStreamParser:
+    """Incrementally separate visible text from <think> blocks in a stream"""
+    
+    def __init__(self):
+        self.in_think = False
+        self.seen_think = False
+        self.clean = []  # Visible text fed so far, outside think blocks
+        self._tail = ""  # Possible partial tag held back for the next feed
+    
+    def feed(self, text):
+        """Consume newly streamed text and return its visible part"""
+        text = self._tail + text
+        visible = []
+        pos = 0
+        while True:
+            tag = '</think>' if self.in_think else '<think>'
+            idx = text.find(tag, pos)
+            if idx == -1:
+                break
+            if not self.in_think:
+                visible.append(text[pos:idx])
+            self.in_think = not self.in_think
+            self.seen_think = True
+            pos = idx + len(tag)
+        
+        # Hold back a suffix that may be the start of the next tag
+        keep = 0
+        for k in range(min(len(tag) - 1, len(text) - pos), 0, -1):
+            if text.endswith(tag[:k]):
+                keep = k
+                break
+        self._tail = text[len(text) - keep:] if keep else ""
+        if not self.in_think:
+            visible.append(text[pos:len(text) - keep])
+        
+        chunk = "".join(visible)
+        self.clean.append(chunk)
+        return chunk
+
+# One entry of the conversation history; immutable, so snapshots can share them
+ChatMessage = namedtuple('ChatMessage', ['role', 'content', 'time'])
+
+class _HistoryStore:
+    """Mirror of conversation_history in SQLite, keyed by history index"""
+    
+    def __init__(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; changes spanning statements use an explicit transaction
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages"
+            " (idx INTEGER PRIMARY KEY, role TEXT NOT NULL, content TEXT NOT NULL, time TEXT)"
+        )
+    
+    def load(self):
+        """Return the stored conversation as a list of ChatMessages"""
+        rows = self._db.execute("SELECT role, content, time FROM messages ORDER BY idx")
+        return [ChatMessage(*row) for row in rows]
+    
+    def put(self, idx, message):
+        """Store message at history index idx, replacing any previous one"""
+        self._db.execute(
+            "INSERT OR REPLACE INTO messages (idx, role, content, time) VALUES (?, ?, ?, ?)",
+            (idx, *message)
+        )
+    
+    def truncate(self, start_idx):
+        """Delete the messages from history index start_idx onwards"""
+        self._db.execute("DELETE FROM messages WHERE idx >= ?", (start_idx,))
+    
+    def replace_from(self, idx, message):
+        """Store message at history index idx and delete everything after it"""
+        self._db.execute("BEGIN")
+        try:
+            self.put(idx, message)
+            self.truncate(idx + 1)
+        except sqlite3.Error:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+    
+    def close(self):
+        self._db.close()
+
+@dataclass
+class MessageRecord:
+    """Direct handles to the widgets of one rendered message"""
+    container: ctk.CTkFrame
+    bubble: ctk.CTkFrame
+    label: object  # CTkLabel, or CTkTextbox while streaming
+    role: str
+    history_idx: int
+    edit_button: ctk.CTkButton | None = None  # User messages only
+
 class OllamaGuiApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -43,21 +168,104 @@ class OllamaGuiApp(ctk.CTk):
         # Configure window
         self.configure(fg_color=COLORS['bg'])
         
-        # Initialize Ollama client
-        self.client = Client(host=OLLAMA_HOST)
+        # Shared fonts, created once the root window exists
+        self._fonts = {
+            'title': ctk.CTkFont(size=20, weight="bold"),
+            'body': ctk.CTkFont(size=15),
+            'ui': ctk.CTkFont(size=14),
+            'ui_bold': ctk.CTkFont(size=14, weight="bold"),
+            'thinking': ctk.CTkFont(size=13),
+            'small': ctk.CTkFont(size=12),
+            'meta': ctk.CTkFont(size=11),
+            'emoji': ctk.CTkFont(size=24),
+            'action': ctk.CTkFont(size=18)
+        }
+        
+        # The Ollama client is built lazily on the event loop thread (see
+        # _get_client) so its setup doesn't delay the first paint
+        self.client = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="ollama-ui", daemon=True).start()
         
         # App state
         self.conversation_history = []
+        self._history_store = None  # Opened by _initialize_app
         self.selected_model = ctk.StringVar()
+        self._model_names = None  # Names listed in the model selector; None until models load
+        self._warmed_model = None  # Last model asked to load ahead of use
         self.is_generating = False
+        self._msg_row_counter = 1  # Next free grid row; row 0 holds the earlier-messages button
+        self._message_rows = []  # Rendered MessageRecords, in chat order
+        self._rendered_from = 0  # History index of the first rendered message
+        self._earlier_button = None
+        self._current_future = None  # Future of the response being streamed
+        self._stream_started = False  # Set by _stream_response once it runs
+        self._closing = False  # Set once the window starts closing; the loop stops queuing UI calls
+        self._wraplength = 700  # Label wrap width, updated as the chat resizes
+        self._flush_job = None
+        self._resize_job = None
+        self._rewrap_job = None
+        self._scroll_job = None
+        self._autoscroll = True  # Cleared when the user scrolls away from the bottom
+        self._last_padx = 20  # Matches the padx the chat column is created with
+        self._cached_minute = None
+        self._cached_timestamp = ""
+        
+        # Streaming repaint state, written by the stream and read by the UI timer
+        self._pending_parts = None
+        self._pending_record = None
+        self._painted_count = 0
+        self._stream_parser = None
+        self._showing_clean = False
         
         # Configure grid
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(1, weight=1)
         
         self._create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
         self.after(100, self._initialize_app)
     
+    def _on_close(self):
+        """Cancel background work and stop the event loop before closing"""
+        self._closing = True
+        for job in (self._flush_job, self._resize_job, self._rewrap_job, self._scroll_job):
+            if job is not None:
+                self.after_cancel(job)
+        if self._history_store is not None:
+            self._history_store.close()
+        
+        # Stop the loop only once cancelled requests have closed their streams
+        self.withdraw()
+        shutdown = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        shutdown.add_done_callback(lambda future: self._loop.stop())
+        try:
+            shutdown.result(timeout=SHUTDOWN_TIMEOUT)
+        except Exception:
+            pass
+        self.destroy()
+    
+    async def _shutdown(self):
+        """Cancel and await every pending request, then close the HTTP client"""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.client is not None:
+            try:
+                await self.client._client.aclose()
+            except Exception:
+                pass
+    
+    def _call_ui(self, callback, *args):
+        """Queue callback on the UI thread, unless the window is closing (loop thread)"""
+        if self._closing:
+            return
+        try:
+            self.after(0, callback, *args)
+        except (RuntimeError, tkinter.TclError):
+            pass  # The window was destroyed in the meantime
+    
     def _create_widgets(self):
         """Create all UI widgets"""
         # Header with model selector
@@ -90,7 +298,7 @@ class OllamaGuiApp(ctk.CTk):
         title_label = ctk.CTkLabel(
             self.header_frame, 
             text="🦙 Kramer UI for Ollama", 
-            font=ctk.CTkFont(size=20, weight="bold"),  # Increased from 18
+            font=self._fonts['title'],
             text_color=COLORS['text']
         )
         title_label.grid(row=0, column=0, padx=20, pady=15, sticky="w")
@@ -102,7 +310,7 @@ class OllamaGuiApp(ctk.CTk):
         model_label = ctk.CTkLabel(
             model_frame, 
             text="Model:", 
-            font=ctk.CTkFont(size=14),  # Increased from 12
+            font=self._fonts['ui'],
             text_color=COLORS['text_muted']
         )
         model_label.grid(row=0, column=0, padx=(0, 10))
@@ -110,10 +318,11 @@ class OllamaGuiApp(ctk.CTk):
         self.model_selector = ctk.CTkOptionMenu(
             model_frame,
             variable=self.selected_model,
+            command=self._on_model_selected,
             values=["Loading..."],
             state="disabled",
             width=200,
-            font=ctk.CTkFont(size=14),  # Added font size
+            font=self._fonts['ui'],
             fg_color=COLORS['surface_light'],
             button_color=COLORS['accent'],
             button_hover_color=COLORS['accent_hover']
@@ -129,7 +338,7 @@ class OllamaGuiApp(ctk.CTk):
             height=32,
             fg_color=COLORS['surface_light'],
             hover_color=COLORS['accent'],
-            font=ctk.CTkFont(size=14)  # Increased from 12
+            font=self._fonts['ui']
         )
         self.new_chat_btn.grid(row=0, column=2, padx=(15, 0))
     
@@ -162,19 +371,31 @@ class OllamaGuiApp(ctk.CTk):
         right_spacer = ctk.CTkFrame(self.main_container, fg_color="transparent", width=0)
         right_spacer.grid(row=0, column=2, sticky="nsew")
         
-        # Bind to window resize to enforce max width
-        self.bind("<Configure>", self._on_window_resize)
+        # Bind to window resize to enforce max width. A binding on the root
+        # would also fire for every child widget's <Configure> (and replace
+        # CTk's own handler), so use a tag that only the root window carries
+        self.bindtags(self.bindtags() + (ROOT_RESIZE_TAG,))
+        self.bind_class(ROOT_RESIZE_TAG, "<Configure>", self._on_window_resize)
     
     def _on_window_resize(self, event):
         """Handle window resize to maintain max chat width"""
-        if event.widget == self:
-            window_width = self.winfo_width()
-            if window_width > MAX_CHAT_WIDTH + 40:  # 40 for padding
-                # Calculate side padding to center the chat
-                side_padding = (window_width - MAX_CHAT_WIDTH) // 2
-                self.chat_container.grid_configure(padx=side_padding)
-            else:
-                self.chat_container.grid_configure(padx=20)
+        # Only lay out once the window has stopped changing size
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(RESIZE_DEBOUNCE_MS, self._apply_resize)
+    
+    def _apply_resize(self):
+        """Center the chat column for the current window width"""
+        self._resize_job = None
+        window_width = self.winfo_width()
+        if window_width > MAX_CHAT_WIDTH + 40:  # 40 for padding
+            # Calculate side padding to center the chat
+            side_padding = (window_width - MAX_CHAT_WIDTH) // 2
+        else:
+            side_padding = 20
+        if side_padding != self._last_padx:
+            self._last_padx = side_padding
+            self.chat_container.grid_configure(padx=side_padding)
     
     def _create_chat_area(self):
         """Create scrollable chat area"""
@@ -187,6 +408,43 @@ class OllamaGuiApp(ctk.CTk):
         )
         self.chat_frame.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
         self.chat_frame.grid_columnconfigure(0, weight=1)
+        
+        # Add to (not replace) CTk's own binding that maintains the scroll region
+        self.chat_frame._parent_canvas.bind("<Configure>", self._on_chat_resize, add="+")
+        
+        # Follow new messages only while the user hasn't scrolled up; CTk scrolls
+        # the wheel through bind_all, so listen the same way
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_all(sequence, self._on_user_scroll, add="+")
+        self.chat_frame._scrollbar.bind("<ButtonRelease-1>", self._on_user_scroll, add="+")
+        
+        self._create_messages_container()
+    
+    def _create_messages_container(self):
+        """Create the frame that holds all message rows"""
+        self._messages_container = ctk.CTkFrame(self.chat_frame, fg_color="transparent")
+        self._messages_container.grid(row=0, column=0, sticky="nsew")
+        self._messages_container.grid_columnconfigure(0, weight=1)
+    
+    def _on_chat_resize(self, event):
+        """Derive the message wrap width from the visible chat width"""
+        wraplength = max(300, self.chat_frame._reverse_widget_scaling(event.width) - 80)
+        if wraplength == self._wraplength:
+            return
+        self._wraplength = wraplength
+        # Rewrap the rendered messages once the width has settled
+        if self._rewrap_job is not None:
+            self.after_cancel(self._rewrap_job)
+        self._rewrap_job = self.after(RESIZE_DEBOUNCE_MS, self._rewrap_messages)
+    
+    def _rewrap_messages(self):
+        """Apply the current wrap width to every rendered message label"""
+        self._rewrap_job = None
+        wraplength = self._wraplength
+        for record in self._message_rows:
+            # The streaming message is a textbox that wraps on its own
+            if isinstance(record.label, ctk.CTkLabel):
+                record.label.configure(wraplength=wraplength)
     
     def _create_input_area(self):
         """Create input area with text box and send button"""
@@ -206,11 +464,10 @@ class OllamaGuiApp(ctk.CTk):
             corner_radius=10,
             fg_color=COLORS['surface_light'],
             border_color=COLORS['surface_light'],
-            font=ctk.CTkFont(size=14)  # Increased from 12
+            font=self._fonts['ui']
         )
         self.user_input.grid(row=0, column=0, sticky="ew", padx=15, pady=15)
         self.user_input.bind("<Return>", self._on_enter_key)
-        self.user_input.bind("<Shift-Return>", self._on_shift_enter)
         
         # Send button
         self.send_button = ctk.CTkButton(
@@ -222,7 +479,7 @@ class OllamaGuiApp(ctk.CTk):
             corner_radius=10,
             fg_color=COLORS['accent'],
             hover_color=COLORS['accent_hover'],
-            font=ctk.CTkFont(size=14, weight="bold")  # Increased from 12
+            font=self._fonts['ui_bold']
         )
         self.send_button.grid(row=0, column=1, padx=(0, 15), pady=15)
     
@@ -239,7 +496,7 @@ class OllamaGuiApp(ctk.CTk):
         self.status_label = ctk.CTkLabel(
             self.status_frame,
             text=f"Connecting to {OLLAMA_HOST}...",
-            font=ctk.CTkFont(size=12),  # Increased from 10
+            font=self._fonts['small'],
             text_color=COLORS['text_muted']
         )
         self.status_label.pack(side="left", padx=10, pady=2)
@@ -247,36 +504,98 @@ class OllamaGuiApp(ctk.CTk):
     def _initialize_app(self):
         """Initialize the app by fetching models"""
         self._update_status("Connecting to Ollama server...")
-        threading.Thread(target=self._fetch_models, daemon=True).start()
+        
+        # Show the last known models right away; the fetch below refreshes them
+        cached_models = self._load_model_cache()
+        if cached_models:
+            self._update_model_list(cached_models)
+        
+        # Restore the conversation from the last session
+        self._open_history_store()
+        if self.conversation_history:
+            self._render_history(max(0, len(self.conversation_history) - MAX_RENDERED_MESSAGES))
+        
+        asyncio.run_coroutine_threadsafe(self._fetch_models(), self._loop)
+    
+    def _load_model_cache(self):
+        """Return the cached model list if it is recent enough, else None"""
+        try:
+            with open(MODEL_CACHE_PATH, encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - data['ts'] < MODEL_CACHE_TTL:
+                return data['models']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+    
+    def _save_model_cache(self, model_names):
+        """Write the model list to the cache file atomically"""
+        try:
+            MODEL_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = MODEL_CACHE_PATH.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'ts': time.time(), 'models': model_names}, f)
+            os.replace(tmp_path, MODEL_CACHE_PATH)
+        except OSError:
+            pass
+    
+    def _open_history_store(self):
+        """Open the history store and load its conversation; skipped on failure"""
+        try:
+            store = _HistoryStore(HISTORY_DB_PATH)
+        except (OSError, sqlite3.Error):
+            return
+        try:
+            self.conversation_history = store.load()
+        except sqlite3.Error:
+            store.close()
+            return
+        self._history_store = store
+    
+    def _persist(self, method, *args):
+        """Mirror a history change to the store; persistence is best-effort"""
+        if self._history_store is None:
+            return
+        try:
+            method(self._history_store, *args)
+        except sqlite3.Error:
+            pass
+    
+    def _get_client(self):
+        """Return the Ollama client, creating it on first use (loop thread only)"""
+        if self.client is None:
+            # Keep connections alive across the pause while the user types the next
+            # message, and never time out reads so long pauses between streamed
+            # chunks don't abort a response
+            self.client = AsyncClient(
+                host=OLLAMA_HOST,
+                timeout=httpx.Timeout(60.0, connect=5.0, read=None),
+                limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300.0)
+            )
+        return self.client
     
-    def _fetch_models(self):
+    async def _fetch_models(self):
         """Fetch available models from Ollama"""
         try:
-            response = self.client.list()
+            response = await self._get_client().list()
             models = response.get('models', [])
             
             if not models:
-                self.after(0, self._handle_no_models)
+                self._call_ui(self._handle_no_models)
                 return
             
-            # Extract model names from Model objects
-            model_names = []
-            for model in models:
-                if hasattr(model, 'model'):
-                    model_names.append(model.model)
-                elif isinstance(model, dict) and 'name' in model:
-                    model_names.append(model['name'])
-                elif isinstance(model, dict) and 'model' in model:
-                    model_names.append(model['model'])
+            # Extract model names from Model objects (or plain dicts)
+            model_names = [name for name in map(_model_name, models) if name]
 
             if not model_names:
-                self.after(0, self._handle_no_models)
+                self._call_ui(self._handle_no_models)
                 return
                 
-            self.after(0, self._update_model_list, model_names)
+            self._call_ui(self._update_model_list, model_names)
+            self._save_model_cache(model_names)
             
         except Exception as e:
-            self.after(0, self._handle_connection_error, str(e))
+            self._call_ui(self._handle_connection_error, str(e))
 
     def _update_model_list(self, model_names):
         """Update the model selector with available models"""
@@ -284,17 +603,46 @@ class OllamaGuiApp(ctk.CTk):
             self._handle_no_models()
             return
             
-        self.model_selector.configure(values=model_names, state="normal")
-        self.selected_model.set(model_names[0])
+        # Rebuilding the dropdown menu is skipped when the list is unchanged
+        names = tuple(model_names)
+        if names != self._model_names:
+            self._model_names = names
+            self.model_selector.configure(values=model_names, state="normal")
+            if self.selected_model.get() not in names:
+                self.selected_model.set(model_names[0])
         self._update_status(f"Ready • {len(model_names)} models available")
+        self._prewarm_model(self.selected_model.get())
+    
+    def _on_model_selected(self, model):
+        """Load the model the user picked; Ollama may have unloaded it since"""
+        self._warmed_model = None
+        self._prewarm_model(model)
+    
+    def _prewarm_model(self, model):
+        """Have Ollama load the selected model before the first message needs it"""
+        if model == self._warmed_model:
+            return
+        self._warmed_model = model
+        asyncio.run_coroutine_threadsafe(self._load_model(model), self._loop)
+    
+    async def _load_model(self, model):
+        """Load a model into memory; an empty prompt generates nothing"""
+        try:
+            await self._get_client().generate(model=model, prompt="")
+        except Exception:
+            pass  # Only an optimization; a real request reports any error
     
     def _handle_no_models(self):
         """Handle case when no models are available"""
+        self._model_names = None
+        self._warmed_model = None
         self.model_selector.configure(values=["No models found"], state="disabled")
         self._update_status("No models found. Run 'ollama pull <model>' to install a model.")
     
     def _handle_connection_error(self, error):
         """Handle connection errors"""
+        self._model_names = None
+        self._warmed_model = None  # Warm again once the server is back
         self.model_selector.configure(values=["Connection Error"], state="disabled")
         self._update_status(f"Connection failed: {error}")
     
@@ -304,16 +652,21 @@ class OllamaGuiApp(ctk.CTk):
     
     def _parse_thinking_content(self, content):
         """Parse content to separate thinking sections from regular content"""
-        # Pattern to match <think>...</think> blocks
-        think_pattern = r'<think>(.*?)</think>'
-        
-        # Find all thinking blocks
-        thinking_blocks = re.findall(think_pattern, content, re.DOTALL)
+        # Most models never emit think blocks
+        if '<think>' not in content:
+            return content.strip(), []
         
-        # Remove thinking blocks from main content
-        clean_content = re.sub(think_pattern, '', content, flags=re.DOTALL).strip()
+        # One pass collects the blocks and the text between them
+        clean_parts = []
+        thinking_blocks = []
+        last = 0
+        for match in _THINK_RE.finditer(content):
+            clean_parts.append(content[last:match.start()])
+            thinking_blocks.append(match.group(1))
+            last = match.end()
+        clean_parts.append(content[last:])
         
-        return clean_content, thinking_blocks
+        return "".join(clean_parts).strip(), thinking_blocks
     
     def _create_thinking_dropdown(self, parent, thinking_blocks):
         """Create a collapsible dropdown for thinking content"""
@@ -334,7 +687,7 @@ class OllamaGuiApp(ctk.CTk):
             height=28,
             fg_color=COLORS['surface_light'],
             hover_color=COLORS['surface'],
-            font=ctk.CTkFont(size=12),
+            font=self._fonts['small'],
             text_color=COLORS['text_muted']
         )
         toggle_btn.pack(anchor="w", pady=(0, 5))
@@ -364,7 +717,7 @@ class OllamaGuiApp(ctk.CTk):
                 corner_radius=8,
                 fg_color=COLORS['surface'],
                 border_color=COLORS['surface_light'],
-                font=ctk.CTkFont(size=13),
+                font=self._fonts['thinking'],
                 text_color=COLORS['text_muted'],
                 wrap="word"
             )
@@ -377,108 +730,232 @@ class OllamaGuiApp(ctk.CTk):
         
         self._scroll_to_bottom()
     
-    def _add_message(self, role, content, is_streaming=False):
+    def _add_message(self, role, content, is_streaming=False, history_idx=None, timestamp=None):
         """Add a message bubble to the chat"""
+        colors = COLORS  # Local alias; this runs for every message
         # Create message container (this is the outer row)
         msg_container = ctk.CTkFrame(
-            self.chat_frame,
+            self._messages_container,
             fg_color="transparent"
         )
-        msg_container.grid(row=len(self.chat_frame.winfo_children()), column=0, sticky="ew", pady=8)
+        msg_container.grid(row=self._msg_row_counter, column=0, sticky="ew", pady=8)
+        self._msg_row_counter += 1
         msg_container.grid_columnconfigure(0, weight=1)
+        if history_idx is None:
+            history_idx = len(self.conversation_history)
 
         # Configure alignment and colors based on role
         if role == "user":
-            anchor = "right"
-            bg_color = COLORS['user_bubble']
+            bg_color = colors['user_bubble']
             text_color = "white"
-            clean_content = content
-            thinking_blocks = []
         else:  # assistant
-            anchor = "left"
-            bg_color = COLORS['ai_bubble']
-            text_color = COLORS['text']
-            clean_content, thinking_blocks = self._parse_thinking_content(content)
-
-        # Create a wrapper to stack bubble and controls vertically
-        vertical_stack = ctk.CTkFrame(msg_container, fg_color="transparent")
-        vertical_stack.pack(
-            side=anchor,
-            padx=10,
-            fill="x" if role == "assistant" else "none",
-            expand=True if role == "assistant" else False,
-            anchor="n"  # Align the whole stack to the top of its row
-        )
+            bg_color = colors['ai_bubble']
+            text_color = colors['text']
 
-        # Create message bubble, now a child of the vertical_stack
+        # Create message bubble in the row's first grid row; controls go below it
         bubble = ctk.CTkFrame(
-            vertical_stack,
+            msg_container,
             fg_color=bg_color,
             corner_radius=15
         )
-        bubble.pack(fill="x", expand=True)  # Bubble fills the stack horizontally
+        # User bubbles hug the right edge, assistant bubbles span the row
+        bubble.grid(row=0, column=0, sticky=_ROW_STICKY[role], padx=10)
+
+        record = MessageRecord(msg_container, bubble, None, role, history_idx)
+        self._message_rows.append(record)
+
+        if is_streaming:
+            # Streaming text is appended incrementally, so use a read-only textbox
+            record.label = ctk.CTkTextbox(
+                bubble,
+                height=40,
+                border_width=0,
+                fg_color=bg_color,
+                font=self._fonts['body'],
+                text_color=text_color,
+                wrap="word",
+                activate_scrollbars=False
+            )
+            record.label.pack(padx=18, pady=12, fill="x")
+            self._set_stream_text(record.label, content)
+        else:
+            self._fill_message(record, content, timestamp)
+
+        self._scroll_to_bottom(force=(role == "user"))
+        return record
+    
+    def _fill_message(self, record, content, timestamp=None):
+        """Add the final text, thinking dropdown and controls to a message bubble"""
+        colors = COLORS
+        role = record.role
+        if role == "user":
+            text_color = "white"
+            clean_content = content
+            thinking_blocks = []
+        else:  # assistant
+            text_color = colors['text']
+            clean_content, thinking_blocks = self._parse_thinking_content(content)
 
         # Add thinking dropdown if there are thinking blocks (AI messages only)
-        if role == "assistant" and thinking_blocks and not is_streaming:
-            self._create_thinking_dropdown(bubble, thinking_blocks)
+        if thinking_blocks:
+            self._create_thinking_dropdown(record.bubble, thinking_blocks)
 
         # Add message content (cleaned of thinking tags)
         display_content = clean_content if clean_content.strip() else content
-        message_label = ctk.CTkLabel(
-            bubble,
+        record.label = ctk.CTkLabel(
+            record.bubble,
             text=display_content,
-            font=ctk.CTkFont(size=15),
+            font=self._fonts['body'],
             text_color=text_color,
-            wraplength=700,
+            wraplength=self._wraplength,
             justify="left"
         )
-        message_label.pack(padx=18, pady=12, anchor="w")
-
-        # --- Add controls and timestamp below the bubble for completed messages ---
-        if not is_streaming:
-            # Create a container for timestamp and buttons, packed below the bubble
-            controls_frame = ctk.CTkFrame(vertical_stack, fg_color="transparent")
-            controls_frame.pack(fill="x", padx=5, pady=(2, 0))
-            controls_frame.grid_columnconfigure(0, weight=1)  # Make left side expandable
-
-            # Timestamp
-            timestamp = datetime.now().strftime("%H:%M")
-            time_label = ctk.CTkLabel(
+        record.label.pack(padx=18, pady=12, anchor="w")
+
+        # --- Add controls and timestamp below the bubble ---
+        # Create a container for timestamp and buttons, gridded below the bubble
+        controls_frame = ctk.CTkFrame(record.container, fg_color="transparent")
+        controls_frame.grid(row=1, column=0, sticky=_ROW_STICKY[role], padx=15, pady=(2, 0))
+        controls_frame.grid_columnconfigure(0, weight=1)  # Make left side expandable
+
+        # Timestamp
+        if timestamp is None:
+            timestamp = self._current_timestamp()
+        time_label = ctk.CTkLabel(
+            controls_frame,
+            text=timestamp,
+            font=self._fonts['meta'],
+            text_color=colors['text_muted']
+        )
+        # Align timestamp to the natural side of the bubble
+        time_label.grid(row=0, column=0, sticky="w" if role == "assistant" else "e")
+
+        # Add edit button ONLY for user messages
+        if role == "user":
+            record.edit_button = ctk.CTkButton(
                 controls_frame,
-                text=timestamp,
-                font=ctk.CTkFont(size=11),
+                text="✍️",
+                command=lambda rec=record: self._start_edit(rec),
+                font=self._fonts['emoji'],
+                width=28,
+                height=28,
+                fg_color="transparent",
+                hover_color=colors['surface_light']
+            )
+            record.edit_button.grid(row=0, column=1, sticky="e")
+    
+    def _trim_rendered_messages(self):
+        """Unrender the oldest messages beyond MAX_RENDERED_MESSAGES"""
+        excess = len(self._message_rows) - MAX_RENDERED_MESSAGES
+        if excess <= 0:
+            return
+        
+        for record in self._message_rows[:excess]:
+            record.container.destroy()
+        del self._message_rows[:excess]
+        # Not every row is a history entry (an error bubble isn't), so count
+        # unrendered messages from the first remaining row's history index
+        self._rendered_from = self._message_rows[0].history_idx
+        self._update_earlier_button()
+    
+    def _update_earlier_button(self):
+        """Show how many earlier messages are hidden, or remove the button"""
+        if self._rendered_from == 0:
+            if self._earlier_button is not None:
+                self._earlier_button.destroy()
+                self._earlier_button = None
+            return
+        
+        if self._earlier_button is None:
+            self._earlier_button = ctk.CTkButton(
+                self._messages_container,
+                command=self._show_earlier_messages,
+                height=28,
+                fg_color=COLORS['surface_light'],
+                hover_color=COLORS['surface'],
+                font=self._fonts['small'],
                 text_color=COLORS['text_muted']
             )
-            # Align timestamp to the natural side of the bubble
-            time_label.grid(row=0, column=0, sticky="w" if role == "assistant" else "e")
-
-            # Add edit button ONLY for user messages
-            if role == "user":
-                current_message_index = len(self.conversation_history)
-                # --- FIX STARTS HERE ---
-                # 1. Create the button first without the command
-                edit_button = ctk.CTkButton(
-                    controls_frame,
-                    text="✍️",
-                    font=ctk.CTkFont(size=24),
-                    width=28,
-                    height=28,
-                    fg_color="transparent",
-                    hover_color=COLORS['surface_light']
-                )
-                # 2. Now that the button object exists, configure its command
-                edit_button.configure(command=lambda idx=current_message_index, btn=edit_button: self._start_edit(idx, btn))
-                # 3. Place the button on the grid
-                edit_button.grid(row=0, column=1, sticky="e")
-                # --- FIX ENDS HERE ---
-
-
-        self._scroll_to_bottom()
-        return message_label
+            self._earlier_button.grid(row=0, column=0, pady=(8, 0))
+        self._earlier_button.configure(text=f"Show {self._rendered_from} earlier messages")
+    
+    def _show_earlier_messages(self):
+        """Render another page of older messages above the current ones"""
+        if self.is_generating:
+            return
+        self._render_history(max(0, self._rendered_from - MAX_RENDERED_MESSAGES))
+        # Replaces the scroll-to-bottom queued while rebuilding
+        self._set_scroll_job(self.after(20, self.chat_frame._parent_canvas.yview_moveto, 0.0))
+        self._autoscroll = False
+    
+    def _render_history(self, start_idx):
+        """Rebuild the chat view from conversation_history[start_idx:]"""
+        self._messages_container.destroy()
+        self._create_messages_container()
+        self._msg_row_counter = 1
+        self._message_rows = []
+        self._earlier_button = None
+        self._rendered_from = start_idx
+        
+        for idx in range(start_idx, len(self.conversation_history)):
+            message = self.conversation_history[idx]
+            self._add_message(message.role, message.content, history_idx=idx, timestamp=message.time)
+        self._update_earlier_button()
+    
+    def _current_timestamp(self):
+        """Return the HH:MM timestamp, formatted once per minute"""
+        minute = int(time.time() // 60)
+        if minute != self._cached_minute:
+            self._cached_minute = minute
+            self._cached_timestamp = datetime.now().strftime("%H:%M")
+        return self._cached_timestamp
+    
+    def _set_stream_text(self, textbox, text):
+        """Replace the text of a streaming message textbox"""
+        textbox.configure(state="normal")
+        textbox.delete("1.0", "end")
+        textbox.insert("end", text)
+        textbox.configure(state="disabled")
+        self._fit_textbox_height(textbox)
+    
+    def _append_stream_text(self, textbox, delta):
+        """Append newly streamed text to a streaming message textbox"""
+        textbox.configure(state="normal")
+        textbox.insert("end", delta)
+        textbox.configure(state="disabled")
+        self._fit_textbox_height(textbox)
+    
+    def _fit_textbox_height(self, textbox):
+        """Resize a textbox to the pixel height of its wrapped content"""
+        inner = textbox._textbox
+        pixels = int(inner.tk.call(inner._w, "count", "-update", "-ypixels", "1.0", "end"))
+        textbox.configure(height=textbox._reverse_widget_scaling(pixels) + 16)
+    
+    def _scroll_to_bottom(self, force=False):
+        """Scroll chat to bottom, unless the user has scrolled up to read"""
+        if force:
+            self._autoscroll = True
+        if self._autoscroll:
+            # Let pending layout grow the scroll region before moving
+            self._set_scroll_job(self.after(10, self.chat_frame._parent_canvas.yview_moveto, 1.0))
     
-    def _scroll_to_bottom(self):
-        """Scroll chat to bottom"""
-        self.after(10, lambda: self.chat_frame._parent_canvas.yview_moveto(1.0))
+    def _on_user_scroll(self, event):
+        """Re-check whether to follow new messages once a user scroll has applied"""
+        self.after_idle(self._update_autoscroll)
+    
+    def _update_autoscroll(self):
+        """Follow new messages only while the view is at the bottom"""
+        self._autoscroll = self.chat_frame._parent_canvas.yview()[1] > 0.98
+    
+    def _schedule_scroll(self):
+        """Scroll to bottom once a layout change has settled"""
+        self._set_scroll_job(self.after_idle(self._scroll_to_bottom))
+    
+    def _set_scroll_job(self, job):
+        """Replace the pending scroll, so repeated requests scroll only once"""
+        if self._scroll_job is not None:
+            self.after_cancel(self._scroll_job)
+        self._scroll_job = job
     
     def _on_enter_key(self, event):
         """Handle Enter key press"""
@@ -487,20 +964,20 @@ class OllamaGuiApp(ctk.CTk):
             return "break"
         return None
     
-    def _on_shift_enter(self, event):
-        """Handle Shift+Enter for new lines"""
-        return None
-    
     def _send_message(self):
         """Send user message and get AI response"""
         user_text = self.user_input.get("1.0", "end-1c").strip()
         
-        if not user_text or self.is_generating or self.model_selector.cget("state") == "disabled":
+        if not user_text or self.is_generating or self._model_names is None:
             return
         
         # Add user message
-        self._add_message("user", user_text)
-        self.conversation_history.append({"role": "user", "content": user_text})
+        timestamp = self._current_timestamp()
+        self._add_message("user", user_text, timestamp=timestamp)
+        message = ChatMessage("user", user_text, timestamp)
+        self._persist(_HistoryStore.put, len(self.conversation_history), message)
+        self.conversation_history.append(message)
+        self._trim_rendered_messages()
         
         # Clear input
         self.user_input.delete("1.0", "end")
@@ -511,61 +988,188 @@ class OllamaGuiApp(ctk.CTk):
         self._update_status("Generating response...")
         
         # Add AI message placeholder
-        ai_label = self._add_message("assistant", "●●●", is_streaming=True)
+        ai_record = self._add_message("assistant", "●●●", is_streaming=True)
         
         # Start streaming in background
-        threading.Thread(
-            target=self._stream_response,
-            args=(self.conversation_history.copy(), ai_label),
-            daemon=True
-        ).start()
+        self._start_stream(tuple(self.conversation_history), ai_record)
     
-    def _stream_response(self, history, ai_label):
+    def _start_stream(self, history, ai_record):
+        """Submit a streaming request and start the repaint timer"""
+        # history is a tuple snapshot of conversation_history; its messages are immutable
+        # The stream only holds a weak reference, so a cleared chat can drop the message
+        record_ref = weakref.ref(ai_record)
+        self._pending_parts = None
+        self._pending_record = record_ref
+        self._painted_count = 0
+        self._stream_parser = _ThinkStreamParser()
+        self._showing_clean = False
+        if self._flush_job is not None:
+            self.after_cancel(self._flush_job)
+        self._flush_job = self.after(STREAM_REPAINT_MS, self._flush_stream_ui)
+        
+        # While streaming, the Send button stops the response instead
+        self.send_button.configure(text="Stop", command=self._stop_generation, state="normal")
+        
+        self._stream_started = False
+        self._current_future = asyncio.run_coroutine_threadsafe(
+            self._stream_response(history, record_ref),
+            self._loop
+        )
+        # Cancelling the future fires this at once, before the task has had a
+        # chance to run. Its first step is queued on the loop by the submit
+        # callback, so check one loop iteration later whether it ever started
+        self._current_future.add_done_callback(
+            lambda future: self._loop.call_soon_threadsafe(
+                self._loop.call_soon, self._check_stream_started
+            )
+        )
+    
+    def _check_stream_started(self):
+        """Clean up after a stream that was cancelled before it ran (loop thread)"""
+        if not self._stream_started:
+            self._call_ui(self._abandon_stream)
+    
+    def _abandon_stream(self):
+        """Drop the placeholder of a stream that never ran and restore input"""
+        if self._pending_record is not None:
+            self._complete_response(self._pending_record, "")
+        self._end_generation()
+    
+    def _stop_generation(self):
+        """Cancel the response being streamed and close its HTTP stream"""
+        if self._current_future is not None:
+            self._current_future.cancel()
+            self._update_status("Stopping...")
+    
+    def _flush_stream_ui(self):
+        """Repaint the streaming message at most once per frame"""
+        self._flush_job = None
+        parts = self._pending_parts
+        record_ref = self._pending_record
+        record = self._streaming_record(record_ref) if record_ref is not None else None
+        if parts is not None and len(parts) != self._painted_count and record is not None:
+            label = record.label
+            # Only the chunks that arrived since the last frame are processed
+            start, count = self._painted_count, len(parts)
+            delta = "".join(parts[start:count])
+            self._painted_count = count
+            parser = self._stream_parser
+            visible = parser.feed(delta)
+            
+            if self._showing_clean:
+                self._append_stream_text(label, visible)
+            elif parser.seen_think and "".join(parser.clean).strip():
+                # The answer has started; from here on hide the thinking
+                self._showing_clean = True
+                self._set_stream_text(label, "".join(parser.clean))
+            elif start == 0:
+                # Replace the placeholder with the raw stream
+                self._set_stream_text(label, delta)
+            else:
+                self._append_stream_text(label, delta)
+            self._scroll_to_bottom()
+        
+        if self.is_generating:
+            self._flush_job = self.after(STREAM_REPAINT_MS, self._flush_stream_ui)
+    
+    async def _stream_response(self, history, record_ref):
         """Stream AI response"""
+        self._stream_started = True
         model = self.selected_model.get()
-        full_response = ""
+        parts = []
+        self._pending_parts = parts  # Joined by _flush_stream_ui on its next tick
         
         try:
-            stream = self.client.chat(model=model, messages=history, stream=True)
+            window = history
+            if MAX_CONTEXT_MESSAGES is not None:
+                # Only a recent window is sent; older turns would just lengthen prefill
+                window = history[-MAX_CONTEXT_MESSAGES:]
+                if len(window) > 1 and window[0].role != 'user':
+                    window = window[1:]  # Start the window on a user turn
+                omitted = len(history) - len(window)
+                if omitted:
+                    self._call_ui(self._update_status,
+                                  f"Generating response... ({omitted} earlier messages not sent)")
+            messages = [{'role': m.role, 'content': m.content} for m in window]
+            stream = await self._get_client().chat(model=model, messages=messages, stream=True)
             
-            for chunk in stream:
-                if not self.is_generating:  # Check if cancelled
-                    break
-                    
-                if 'message' in chunk and 'content' in chunk['message']:
-                    content = chunk['message']['content']
-                    full_response += content
-                    
-                    # For streaming, show raw content but parse for final display
-                    display_content = full_response
-                    if '<think>' in full_response and '</think>' in full_response:
-                        clean_content, _ = self._parse_thinking_content(full_response)
-                        if clean_content.strip():
-                            display_content = clean_content
-                    
-                    self.after(0, lambda: ai_label.configure(text=display_content))
-                    self.after(0, self._scroll_to_bottom)
+            # aclosing() shuts the HTTP stream down on break or cancellation
+            async with aclosing(stream):
+                async for chunk in stream:
+                    if 'message' in chunk and 'content' in chunk['message']:
+                        content = chunk['message']['content']
+                        parts.append(content)
             
-            # After streaming is complete, recreate the message with proper thinking dropdown
-            if full_response.strip():
-                # Remove the streaming message
-                ai_label.master.master.master.destroy() # label -> bubble -> vertical_stack -> msg_container
-                
-                # Add the final message with thinking dropdown
-                self._add_message("assistant", full_response)
-                
-                # Add to conversation history
-                self.conversation_history.append({"role": "assistant", "content": full_response})
+            # After streaming is complete, recreate the message on the UI thread
+            self._call_ui(self._complete_response, record_ref, "".join(parts))
+        
+        except asyncio.CancelledError:
+            # Stopped by the user; keep whatever arrived so far
+            self._call_ui(self._complete_response, record_ref, "".join(parts))
             
         except Exception as e:
             error_msg = f"Error: {str(e)}"
-            self.after(0, lambda: ai_label.configure(text=error_msg))
-            self.after(0, self._update_status, f"Error: {str(e)}")
+            self._call_ui(self._show_stream_error, record_ref, error_msg)
+            self._call_ui(self._update_status, f"Error: {str(e)}")
         
         finally:
-            self.is_generating = False
-            self.after(0, self._toggle_input, True)
-            self.after(0, self._update_status, "Ready")
+            self._pending_parts = None
+            self._call_ui(self._end_generation)
+    
+    def _streaming_record(self, record_ref):
+        """Return the streaming message if it is still on screen, else None"""
+        record = record_ref()
+        if record is None or not record.label.winfo_exists():
+            return None
+        return record
+    
+    def _finish_stream_ui(self):
+        """Stop repainting the streaming message; its final content is about to be set"""
+        # Cleared here on the UI thread, since the stream only clears
+        # _pending_parts after queuing the final update
+        self._pending_parts = None
+        self._pending_record = None
+    
+    def _show_stream_error(self, record_ref, error_msg):
+        """Show an error in place of the streaming message"""
+        self._finish_stream_ui()
+        ai_record = self._streaming_record(record_ref)
+        if ai_record is not None:
+            self._set_stream_text(ai_record.label, error_msg)
+    
+    def _complete_response(self, record_ref, full_response):
+        """Replace the streaming message with the final one and record it"""
+        self._finish_stream_ui()
+        # The chat was cleared while streaming; the reply belongs to nothing
+        ai_record = self._streaming_record(record_ref)
+        if ai_record is None:
+            return
+        
+        if not full_response.strip():
+            # Nothing arrived; drop the streaming message
+            self._message_rows.remove(ai_record)
+            ai_record.container.destroy()
+            return
+        
+        # Swap the streaming textbox for the final text, keeping the bubble
+        timestamp = self._current_timestamp()
+        ai_record.label.destroy()
+        self._fill_message(ai_record, full_response, timestamp)
+        self._scroll_to_bottom()
+        
+        # Add to conversation history
+        message = ChatMessage("assistant", full_response, timestamp)
+        self._persist(_HistoryStore.put, len(self.conversation_history), message)
+        self.conversation_history.append(message)
+        self._trim_rendered_messages()
+    
+    def _end_generation(self):
+        """Re-enable input once a response has finished or failed"""
+        self.is_generating = False
+        self._current_future = None
+        self.send_button.configure(text="Send", command=self._send_message)
+        self._toggle_input(True)
+        self._update_status("Ready")
     
     def _toggle_input(self, enabled):
         """Toggle input widgets, including the New Chat button."""
@@ -578,6 +1182,10 @@ class OllamaGuiApp(ctk.CTk):
         if hasattr(self, 'new_chat_btn'): # Ensure new_chat_btn exists
             self.new_chat_btn.configure(state=input_state)
         
+        # Rebuilding the view would discard an open edit or streaming bubble
+        if self._earlier_button is not None:
+            self._earlier_button.configure(state=input_state)
+        
         # Always keep the input box enabled and focused,
         # actual sending is blocked by self.is_generating and send_button state.
         self.user_input.configure(state="normal")
@@ -586,60 +1194,61 @@ class OllamaGuiApp(ctk.CTk):
     
     def _new_chat(self):
         """Start a new chat"""
+        # Stop any response still streaming into the old chat
+        if self._current_future is not None:
+            self._current_future.cancel()
+        
         self.conversation_history.clear()
+        self._persist(_HistoryStore.truncate, 0)
         
-        # Clear chat area
-        for widget in self.chat_frame.winfo_children():
-            widget.destroy()
+        # Clear chat area with a single destroy of the messages container
+        self._messages_container.destroy()
+        self._create_messages_container()
+        self._msg_row_counter = 1
+        self._message_rows = []
+        self._rendered_from = 0
+        self._earlier_button = None
+        self._autoscroll = True
         
         self._update_status("New chat started")
         self.user_input.focus()
 
     def _clear_chat_from_index(self, start_idx):
-        """Remove message containers from the UI from start_idx onwards."""
-        # msg_containers are direct children of self.chat_frame
-        all_msg_containers = self.chat_frame.winfo_children()
-
-        # Ensure start_idx is within bounds
-        if start_idx < 0:
-            start_idx = 0
+        """Remove message containers from the UI from history index start_idx onwards."""
+        # Rows are in history order, but error bubbles have no history entry
+        # of their own, so compare history indices rather than counting rows
+        row_idx = len(self._message_rows)
+        while row_idx > 0 and self._message_rows[row_idx - 1].history_idx >= start_idx:
+            row_idx -= 1
 
-        for i in range(len(all_msg_containers) -1, start_idx -1, -1):
-            if i < len(all_msg_containers): # double check to prevent race conditions if list changes
-                all_msg_containers[i].destroy()
+        for record in reversed(self._message_rows[row_idx:]):
+            record.container.destroy()
+        del self._message_rows[row_idx:]
 
-    def _start_edit(self, msg_idx, edit_button_widget):
+    def _start_edit(self, record):
         """Begin editing a user message."""
         if self.is_generating: # Don't allow edit if AI is generating
             return
 
-        self._toggle_input(False) # Disable main input
-
+        msg_idx = record.history_idx
+        bubble_widget = record.bubble
         try:
-            # button -> controls_frame -> vertical_stack -> bubble is sibling
-            vertical_stack = edit_button_widget.master.master
-            bubble_widget = vertical_stack.winfo_children()[0] # The bubble is the first child
-            original_content = self.conversation_history[msg_idx]['content']
-        except (IndexError, AttributeError):
-            self._toggle_input(True)
+            original_content = self.conversation_history[msg_idx].content
+        except IndexError:
             return
 
-        # Hide the original controls (the frame with the edit button and timestamp)
-        edit_button_widget.master.pack_forget()
+        self._toggle_input(False) # Disable main input
 
-        # Store original children of the bubble
-        original_children = []
-        for child in bubble_widget.winfo_children():
-            original_children.append(child)
+        # Keep the controls in place; the edit button is just unavailable
+        record.edit_button.configure(state="disabled")
 
-        # Clear current bubble content (message_label)
-        for child in original_children:
-            child.pack_forget()
+        # User bubbles hold only their label; hide it while editing
+        record.label.pack_forget()
 
         # Create editing UI inside the bubble
         edit_textbox = ctk.CTkTextbox(
             bubble_widget,
-            font=ctk.CTkFont(size=15),
+            font=self._fonts['body'],
             fg_color=COLORS['surface_light'],
             border_color=COLORS['surface_light'],
             text_color=COLORS['text'],
@@ -653,12 +1262,13 @@ class OllamaGuiApp(ctk.CTk):
         # Edit action buttons frame (remains inside bubble for context)
         actions_frame = ctk.CTkFrame(bubble_widget, fg_color="transparent")
         actions_frame.pack(fill="x", padx=10, pady=(0,10), anchor="e")
+        edit_widgets = (edit_textbox, actions_frame)  # Removed again by _restore_bubble
 
         save_button = ctk.CTkButton(
             actions_frame,
             text="✔️",
-            command=lambda: self._save_edit(msg_idx, edit_textbox, bubble_widget, original_children),
-            font=ctk.CTkFont(size=18),
+            command=lambda: self._save_edit(record, edit_textbox, edit_widgets),
+            font=self._fonts['action'],
             width=28, height=28,
             fg_color="transparent",
             hover_color=COLORS['surface_light']
@@ -668,76 +1278,66 @@ class OllamaGuiApp(ctk.CTk):
         cancel_button = ctk.CTkButton(
             actions_frame,
             text="❌",
-            command=lambda: self._cancel_edit(msg_idx, bubble_widget, original_children, original_content),
-            font=ctk.CTkFont(size=18),
+            command=lambda: self._cancel_edit(record, edit_widgets, original_content),
+            font=self._fonts['action'],
             width=28, height=28,
             fg_color="transparent",
             hover_color=COLORS['surface_light']
         )
         cancel_button.pack(side="right", padx=(0,5))
 
-        self.after(100, self._scroll_to_bottom)
+        self._schedule_scroll()
+
+
+    def _restore_bubble(self, record, edit_widgets, text):
+        """Remove the editing UI and show the message with the given text"""
+        for widget in edit_widgets:
+            widget.destroy()
 
+        record.label.configure(text=text)
+        record.label.pack(padx=18, pady=12, anchor="w")
 
-    def _save_edit(self, msg_idx, textbox_widget, bubble_widget, original_bubble_children):
+        record.edit_button.configure(state="normal")
+
+    def _save_edit(self, record, textbox_widget, edit_widgets):
         """Save the edited message, truncate history, and trigger new AI response."""
+        msg_idx = record.history_idx
         new_text = textbox_widget.get("1.0", "end-1c").strip()
 
         if not new_text: # Do not save if text is empty, maybe show a small error or just cancel
-            self._cancel_edit(msg_idx, bubble_widget, original_bubble_children, self.conversation_history[msg_idx]['content'])
+            self._cancel_edit(record, edit_widgets, self.conversation_history[msg_idx].content)
+            return
+
+        # Saving replaces every later message with a new response; without a
+        # model keep the edit open rather than discard them
+        if self._model_names is None:
+            self._update_status("Cannot generate response: No model selected or connection error.")
             return
 
         # 1. Update conversation_history at msg_idx
-        self.conversation_history[msg_idx]['content'] = new_text
+        self.conversation_history[msg_idx] = self.conversation_history[msg_idx]._replace(content=new_text)
 
         # 2. Truncate UI - Remove all messages after the current one being edited
         self._clear_chat_from_index(msg_idx + 1)
 
         # 3. Truncate conversation_history list
-        self.conversation_history = self.conversation_history[:msg_idx + 1]
+        del self.conversation_history[msg_idx + 1:]
+        self._persist(_HistoryStore.replace_from, msg_idx, self.conversation_history[msg_idx])
 
         # 4. Restore the edited message bubble's original UI with new text
-        for widget in bubble_widget.winfo_children():
-            if widget not in original_bubble_children:
-                widget.destroy()
-
-        for child_widget in original_bubble_children:
-            if isinstance(child_widget, ctk.CTkLabel):
-                child_widget.configure(text=new_text)
-                child_widget.pack(padx=18, pady=12, anchor="w")
-            elif isinstance(child_widget, ctk.CTkFrame):
-                child_widget.pack(fill="x", padx=10, pady=(0, 5))
-            else:
-                child_widget.pack()
-        
-        # Restore the original controls frame that was hidden
-        # The bubble's parent is the vertical_stack
-        vertical_stack = bubble_widget.master
-        # The controls frame is the second child of the stack
-        if len(vertical_stack.winfo_children()) > 1:
-            controls_frame = vertical_stack.winfo_children()[1]
-            controls_frame.pack(fill="x", padx=5, pady=(2, 0)) # Re-pack it
+        self._restore_bubble(record, edit_widgets, new_text)
             
         # 5. Trigger new AI response
-        if self.model_selector.cget("state") == "disabled":
-            self._update_status("Cannot generate response: No model selected or connection error.")
-            self._toggle_input(True)
-            return
-
         self.is_generating = True
         self._toggle_input(False)
         self._update_status("Generating response...")
 
-        ai_label = self._add_message("assistant", "●●●", is_streaming=True)
-        history_for_ai = self.conversation_history.copy()
+        ai_record = self._add_message("assistant", "●●●", is_streaming=True)
+        history_for_ai = tuple(self.conversation_history)
 
-        threading.Thread(
-            target=self._stream_response,
-            args=(history_for_ai, ai_label),
-            daemon=True
-        ).start()
+        self._start_stream(history_for_ai, ai_record)
 
-        self.after(100, self._scroll_to_bottom)
+        self._schedule_scroll()
 
     def _start_regenerate(self, msg_idx, regenerate_button_widget):
         """Regenerate an AI response."""
@@ -747,6 +1347,16 @@ class OllamaGuiApp(ctk.CTk):
         if msg_idx <= 0: # Cannot regenerate if there's no preceding user message
             return
 
+        # Validate before touching history or widgets, so a refusal changes nothing
+        # The history should contain messages UP TO the user message that prompted the AI response.
+        if msg_idx > len(self.conversation_history) or self.conversation_history[msg_idx - 1].role != 'user':
+            self._update_status("Error: Invalid history state for regeneration.")
+            return
+
+        if self._model_names is None:
+            self._update_status("Cannot regenerate: No model selected or connection error.")
+            return
+
         # Briefly disable the button - it will be destroyed and recreated anyway
         if regenerate_button_widget and regenerate_button_widget.winfo_exists():
             regenerate_button_widget.configure(state="disabled")
@@ -756,73 +1366,27 @@ class OllamaGuiApp(ctk.CTk):
         self._update_status("Regenerating response...")
 
         # 1. Truncate conversation_history to exclude the old AI message and anything after
-        # The history should contain messages UP TO the user message that prompted the AI response.
         # If msg_idx is the AI's message, then history should be up to msg_idx (exclusive).
-        self.conversation_history = self.conversation_history[:msg_idx]
+        del self.conversation_history[msg_idx:]
+        self._persist(_HistoryStore.truncate, msg_idx)
 
         # 2. Truncate UI - Remove old AI message and subsequent messages from UI
-        # msg_idx is the index in the chat_frame.winfo_children() list
+        # msg_idx is a history index; _clear_chat_from_index maps it to a rendered row
         self._clear_chat_from_index(msg_idx)
 
         # 3. Trigger new AI response
-        if self.model_selector.cget("state") == "disabled":
-            self._update_status("Cannot regenerate: No model selected or connection error.")
-            self.is_generating = False
-            self._toggle_input(True)
-            return
-
-        # Add AI message placeholder
-        ai_label = self._add_message("assistant", "●●●", is_streaming=True)
+        ai_record = self._add_message("assistant", "●●●", is_streaming=True)
+        self._start_stream(tuple(self.conversation_history), ai_record) # _complete_response appends the new AI response
 
-        # History for AI is the now-truncated self.conversation_history
-        # This history should contain the user message that prompted the original AI response.
-        history_for_ai = self.conversation_history.copy()
+        self._schedule_scroll()
 
-        if not history_for_ai or history_for_ai[-1]['role'] != 'user':
-            # This case should ideally not be reached if msg_idx > 0 and history was user, ai, user, ai ...
-            # However, as a safeguard:
-            self._update_status("Error: Invalid history state for regeneration.")
-            self.is_generating = False
-            self._toggle_input(True)
-            # Clean up the placeholder message
-            if ai_label and ai_label.master and ai_label.master.master:
-                ai_label.master.master.destroy()
-            return
 
-        threading.Thread(
-            target=self._stream_response,
-            args=(history_for_ai, ai_label), # _stream_response appends the new AI response
-            daemon=True
-        ).start()
-
-        self.after(100, self._scroll_to_bottom)
-
-
-    def _cancel_edit(self, msg_idx, bubble_widget, original_bubble_children, original_content):
+    def _cancel_edit(self, record, edit_widgets, original_content):
         """Cancel editing and restore original message."""
-        # Clear editing UI (textbox, Save/Cancel buttons)
-        for widget in bubble_widget.winfo_children():
-            if widget not in original_bubble_children:
-                widget.destroy()
-
-        # Restore original children by repacking them
-        for child_widget in original_bubble_children:
-            if isinstance(child_widget, ctk.CTkLabel):
-                child_widget.configure(text=original_content)
-                child_widget.pack(padx=18, pady=12, anchor="w")
-            elif isinstance(child_widget, ctk.CTkFrame):
-                child_widget.pack(fill="x", padx=10, pady=(0, 5))
-            else:
-                child_widget.pack()
-        
-        # Restore the original controls frame that was hidden
-        vertical_stack = bubble_widget.master
-        if len(vertical_stack.winfo_children()) > 1:
-            controls_frame = vertical_stack.winfo_children()[1]
-            controls_frame.pack(fill="x", padx=5, pady=(2, 0)) # Re-pack it
+        self._restore_bubble(record, edit_widgets, original_content)
 
         self._toggle_input(True) # Re-enable main input
-        self.after(100, self._scroll_to_bottom)
+        self._schedule_scroll()
 
 
 if __name__ == "__main__":